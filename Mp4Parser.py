@@ -1,15 +1,20 @@
 # system imports
+import argparse
 import json
 import os
+import sqlite3
+import struct
 import sys
 import xml.etree.ElementTree as ET
+try: import fcntl # not available on Windows
+except: fcntl = None
 
 from hashlib import md5
 from io      import BytesIO
 from math    import ceil
 from PIL     import Image
-from struct  import unpack
-from time    import time, sleep
+from struct  import calcsize, pack, unpack
+from time    import sleep, strftime, time
 
 # gui imports
 from PyQt5.QtCore    import Qt, QByteArray, QThread, pyqtSignal
@@ -19,6 +24,339 @@ from PyQt5.QtWidgets import QApplication, QDialog, QFileDialog, QHBoxLayout, QLa
 try: from PyQt5 import QtWinExtras
 except: pass
 
+#--------------------------------------------------------------------------------------------------
+# @brief Base class for errors raised while parsing a media file.
+class ParseError(Exception):
+    #----------------------------------------------------------------------------------------------
+    # @brief Construct a parse error with details about the offending atom.
+    # @param message - description of the problem
+    # @param tag - atom tag being parsed (if known)
+    # @param offset - file offset of the atom (if known)
+    # @param size - size of the atom (if known)
+    def __init__(self, message, tag=None, offset=None, size=None):
+        super(ParseError, self).__init__(message)
+        self.filename = None # set by the parser once the error leaves it
+        self.tag      = tag
+        self.offset   = offset
+        self.size     = size
+    # end constructor
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Convert the error to a dictionary for logging.
+    # @return dictionary of the error details
+    def details(self):
+        tag = self.tag.decode('latin-1') if isinstance(self.tag, bytes) else self.tag
+        return { 'File':   self.filename,
+                 'Error':  type(self).__name__,
+                 'Reason': str(self),
+                 'Tag':    tag,
+                 'Offset': self.offset,
+                 'Size':   self.size }
+    # end details
+# end ParseError
+
+#--------------------------------------------------------------------------------------------------
+# @brief An atom has an invalid size (smaller than its header or larger than its parent).
+class AtomSizeError(ParseError): pass
+
+#--------------------------------------------------------------------------------------------------
+# @brief The file ended before a complete atom could be read.
+class TruncatedError(ParseError): pass
+
+#--------------------------------------------------------------------------------------------------
+# @brief An atom payload could not be decoded.
+class TagError(ParseError): pass
+
+#--------------------------------------------------------------------------------------------------
+# @brief A tag required to catalog the file is missing.
+class MissingTagError(ParseError): pass
+
+#--------------------------------------------------------------------------------------------------
+# @brief Base class for exceeding one of the parser limits.
+class LimitError(ParseError):
+    #----------------------------------------------------------------------------------------------
+    # @brief Construct a limit error.
+    # @param name - name of the limit (key in Mp4Parser.LIMITS)
+    # @param limit - configured limit
+    # @param value - value that exceeded the limit
+    # @param kwargs - atom details (see ParseError)
+    def __init__(self, name, limit, value, **kwargs):
+        super(LimitError, self).__init__(f'{name} limit of {limit} exceeded ({value})', **kwargs)
+        self.limit = limit
+        self.value = value
+    # end constructor
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Convert the error to a dictionary for logging.
+    # @return dictionary of the error details
+    def details(self):
+        result = super(LimitError, self).details()
+        result.update({ 'Limit': self.limit, 'Value': self.value })
+        return result
+    # end details
+# end LimitError
+
+class DepthLimitError(LimitError):   pass # containers nested too deep
+class AtomLimitError(LimitError):    pass # too many atoms in a file
+class PayloadLimitError(LimitError): pass # single atom payload too large
+class ReadLimitError(LimitError):    pass # too many bytes read from a file
+class TimeLimitError(LimitError):    pass # parsing a file took too long
+
+#--------------------------------------------------------------------------------------------------
+# @brief Forward only reader over a file, a non-seekable stream or an iterable of byte chunks.
+# Seekable files skip data with a seek, everything else discards it chunk by chunk, so memory use
+# is bounded by the largest read (a single atom) plus one chunk.
+class Stream(object):
+    #----------------------------------------------------------------------------------------------
+    # @brief Number of bytes requested at once from a non-seekable stream.
+    CHUNK = 64 * 1024
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Construct a stream.
+    # @param source - object with a read method (file, sys.stdin.buffer, socket.makefile('rb'))
+    #                 or an iterable of bytes (generator of chunks)
+    # @param chunk - number of bytes to request at once from a non-seekable stream
+    def __init__(self, source, chunk=CHUNK):
+        self._fd       = None          # seekable file
+        self._chunks   = None          # iterator of chunks for everything else
+        self._buffer   = memoryview(b'') # remainder of the current chunk
+        self._position = 0             # number of bytes consumed
+
+        if hasattr(source, 'read'):
+            try: seekable = source.seekable()
+            except: seekable = False
+            if seekable: self._fd = source
+            else: self._chunks = iter(lambda: source.read(chunk), b'')
+        #
+        else:
+            self._chunks = iter(source)
+        #
+    # end constructor
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Determine the ending offset of the stream.
+    # @return the size of a seekable file, None if unknown
+    def end(self):
+        if not self._fd: return None
+        position = self._fd.tell()
+        self._fd.seek(0, os.SEEK_END)
+        end = self._fd.tell()
+        self._fd.seek(position)
+        return end
+    # end end
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Determine if skipping data is a seek (instead of reading and discarding it).
+    def seekable(self):
+        return self._fd is not None
+    # end seekable
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Current offset within the stream.
+    def tell(self):
+        return self._fd.tell() if self._fd else self._position
+    # end tell
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Read bytes from the stream.
+    # @param count - number of bytes to read
+    # @return the bytes read, less than requested at the end of the stream
+    def read(self, count):
+        if self._fd: return self._fd.read(count)
+
+        parts = []
+        while count > 0 and self._fill():
+            part = self._buffer[:count]
+            self._buffer = self._buffer[len(part):]
+            self._position += len(part)
+            count -= len(part)
+            parts.append(part)
+        #
+        return b''.join(parts)
+    # end read
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Discard bytes from the stream without keeping them.
+    # @param count - number of bytes to skip
+    # @return the number of bytes skipped, less than requested at the end of the stream
+    def skip(self, count):
+        if self._fd:
+            self._fd.seek(count, os.SEEK_CUR)
+            return count
+        #
+
+        skipped = 0
+        while skipped < count and self._fill():
+            part = min(count - skipped, len(self._buffer))
+            self._buffer = self._buffer[part:]
+            skipped += part
+        #
+        self._position += skipped
+        return skipped
+    # end skip
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Ensure data is buffered from the next chunk if the current one is consumed.
+    # @return True if data is available, False at the end of the stream
+    def _fill(self):
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None: return False
+            self._buffer = memoryview(chunk).cast('B')
+        #
+        return True
+    # end _fill
+# end Stream
+
+#--------------------------------------------------------------------------------------------------
+# @brief Index of the atoms of a file, so any atom can be read again without walking the tree.
+# Each entry is a tuple(parent entry, offset, size, header length, tag), with a parent of -1 for
+# the top level atoms and a size of 0 for an atom extending to the end of an unbounded stream.
+# The index is saved as a compact binary sidecar that is only trusted while the size and the
+# modification time of the media file are unchanged.
+class AtomIndex(list):
+    #----------------------------------------------------------------------------------------------
+    # @brief Sidecar identification and version.
+    MAGIC   = b'MP4I'
+    VERSION = 1
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Sidecar layout: header (magic, version, file size, file mtime, count) and entries.
+    HEADER = '!4sBQqI'
+    ENTRY  = '!iQQB4s'
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Construct an index.
+    # @param entries - optional entries (parent, offset, size, header size, tag), parents first
+    def __init__(self, entries=()):
+        super().__init__(entries)
+        self._paths = []  # path of each entry, extended as entries are appended
+        self._found = {}  # path -> list of entries with that path
+    # end constructor
+
+    #----------------------------------------------------------------------------------------------
+    # @brief List methods that replace, reorder or remove entries; the paths are found again.
+    # Note: appending (append, extend, +=) keeps the paths found so far
+    def __setitem__(self, *args): self._changed(); super().__setitem__(*args)
+    def __delitem__(self, *args): self._changed(); super().__delitem__(*args)
+    def __imul__(self, *args):    self._changed(); return super().__imul__(*args)
+    def insert(self, *args):      self._changed(); super().insert(*args)
+    def pop(self, *args):         self._changed(); return super().pop(*args)
+    def remove(self, *args):      self._changed(); super().remove(*args)
+    def sort(self, **kwargs):     self._changed(); super().sort(**kwargs)
+    def reverse(self):            self._changed(); super().reverse()
+    def clear(self):              self._changed(); super().clear()
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Forget the paths found so far after the entries changed.
+    def _changed(self):
+        self._paths = []
+        self._found = {}
+    # end _changed
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Determine the sidecar filename for a media file.
+    # @param filename - media file
+    # @param directory - shared directory for the sidecars, None to save next to the media file
+    # @return the sidecar filename
+    @staticmethod
+    def sidecar(filename, directory=None):
+        if directory is None: return filename + '.idx'
+        return os.path.join(directory, md5(os.path.abspath(filename).encode('utf-8')).hexdigest() + '.idx')
+    # end sidecar
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Load the index of a media file from its sidecar.
+    # @param sidecar - sidecar filename
+    # @param filename - media file the index must match
+    # @return the index, or None if there is no valid index for the current file
+    @staticmethod
+    def load(sidecar, filename):
+        try:
+            stat = os.stat(filename)
+            with open(sidecar, 'rb') as fd: data = fd.read()
+            header = calcsize(AtomIndex.HEADER)
+            magic, version, size, mtime, count = unpack(AtomIndex.HEADER, data[:header])
+        #
+        except (OSError, struct.error):
+            return None
+        #
+
+        length = calcsize(AtomIndex.ENTRY)
+        if magic != AtomIndex.MAGIC or version != AtomIndex.VERSION: return None
+        if size != stat.st_size or mtime != stat.st_mtime_ns: return None
+        if len(data) != header + count * length: return None
+
+        index = AtomIndex()
+        for offset in range(header, len(data), length):
+            index.append(unpack(AtomIndex.ENTRY, data[offset:offset+length]))
+        #
+        return index
+    # end load
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Save the index of a media file to a sidecar.
+    # @param sidecar - sidecar filename
+    # @param filename - media file the index belongs to
+    # @throws OSError if the sidecar cannot be written
+    def save(self, sidecar, filename):
+        stat = os.stat(filename)
+        data = [pack(AtomIndex.HEADER, AtomIndex.MAGIC, AtomIndex.VERSION, stat.st_size,
+                     stat.st_mtime_ns, len(self))]
+        data += [pack(AtomIndex.ENTRY, *entry) for entry in self]
+
+        temp = f'{sidecar}.{os.getpid()}.tmp'
+        try:
+            with open(temp, 'wb') as fd: fd.write(b''.join(data))
+            os.replace(temp, sidecar)
+        #
+        except OSError:
+            if os.path.exists(temp): os.remove(temp) # do not leave a partial sidecar behind
+            raise
+        #
+    # end save
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Determine the path of an atom (e.g. moov/udta/meta/ilst/covr).
+    # @param entry - position of the atom in the index
+    # @return the path of the tags separated by /
+    def path(self, entry):
+        tags = []
+        while entry >= 0:
+            tags.append(self[entry][4].decode('latin-1'))
+            entry = self[entry][0]
+        #
+        return '/'.join(reversed(tags))
+    # end path
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Find the atoms with a path.
+    # @param path - path of the atoms (see path)
+    # @return list of entries
+    def find(self, path):
+        # the paths are built once from the parent paths (parents always come first), only the
+        # entries appended since the last call are added
+        for entry in self[len(self._paths):]:
+            tag = entry[4].decode('latin-1')
+            self._paths.append(tag if entry[0] < 0 else self._paths[entry[0]] + '/' + tag)
+            self._found.setdefault(self._paths[-1], []).append(entry)
+        #
+        return list(self._found.get(path, []))
+    # end find
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Read the payload of an atom (without its header).
+    # @param fd - media file opened in binary mode
+    # @param entry - entry of the atom
+    # @return the payload bytes
+    @staticmethod
+    def read(fd, entry):
+        _, offset, size, header, _ = entry
+        fd.seek(offset + header)
+        return fd.read(size - header)
+    # end read
+# end AtomIndex
+
 #--------------------------------------------------------------------------------------------------
 # @brief Class to read and parse MP4/M4A meta data tags.
 class Mp4Parser(dict):
@@ -80,70 +418,238 @@ class Mp4Parser(dict):
                b'tvsn':     'TV season',
                b'vmhd':     'Video info' }
 
+    #----------------------------------------------------------------------------------------------
+    # @brief Default resource limits for parsing a single file, None disables a limit.
+    # depth: maximum nesting of container atoms
+    # atoms: maximum number of atoms visited
+    # payload: maximum size of a single atom payload read into memory [bytes]
+    # bytes: maximum total number of bytes read [bytes]
+    # seconds: maximum wall clock time [seconds]
+    LIMITS = { 'depth':   16,
+               'atoms':   100000,
+               'payload': 64 * 1024 * 1024,
+               'bytes':   256 * 1024 * 1024,
+               'seconds': 60 }
+
     #----------------------------------------------------------------------------------------------
     # @brief Construct a dictionary by reading the atom tags.
-    # @param filename - file path and name to open and parse
-    def __init__(self, filename=None):
+    # @param source - file path and name to open and parse, or a readable stream (see Stream)
+    # @param limits - dictionary overriding some or all of the default LIMITS
+    # @param index - optional sidecar filename (see AtomIndex.sidecar) for the atom index of a file
+    #                path; a valid index is used instead of walking the atoms, otherwise it is saved
+    # @throws ParseError (or a subclass) if the file is corrupt or exceeds a limit
+    def __init__(self, source=None, limits=None, index=None):
         super(dict, self).__init__()
-        if filename is None: return
-
-        with open(filename, 'rb') as fd:
-            fd.seek(0, 2) # go to the end of the file for the size
-            for type, data in self._parse(fd, 0, fd.tell()):
-                self._save(type, data)
+        self.index     = AtomIndex() # atoms of the parsed file
+        self._limits   = dict(Mp4Parser.LIMITS, **(limits or {}))
+        self._atoms    = 0      # number of atoms visited
+        self._bytes    = 0      # number of bytes read
+        self._start    = time() # time parsing started
+        self._moov     = False  # True once the movie (meta data) atom was parsed
+        if source is None: return
+
+        if isinstance(source, (str, bytes, os.PathLike)):
+            atoms = AtomIndex.load(index, source) if index else None
+            with open(source, 'rb') as fd:
+                for _ in self.parse(fd, atoms): pass
+            #
+            if index and atoms is None:
+                # the sidecar is only a cache, a directory that cannot take it is not an error
+                try: self.index.save(index, source)
+                except OSError: pass
             #
         #
+        else:
+            for _ in self.parse(source): pass
+        #
     # end constructor
 
     #----------------------------------------------------------------------------------------------
-    # @brief Parse a range of data for atoms within the file.
-    # @param start - starting offset to look for tags
-    # @param end - ending offset not to exceed
-    # @yields a tuple(tag, data)
-    def _parse(self, fd, begin, end):
-        offset = begin
+    # @brief Parse a file or stream, saving and emitting the tags as soon as each atom is read.
+    # Non-seekable streams are read once from front to back; ignored atoms (like the media data)
+    # are discarded as they arrive, so the meta data is found even when it follows the media.
+    # @param source - seekable file, readable stream, iterable of byte chunks, or a Stream
+    # @param atoms - optional index of the file to read the tags from directly (seekable files only)
+    # @yields a tuple(key, value) for each value saved into the dictionary
+    # @throws ParseError (or a subclass) if the data is corrupt or exceeds a limit
+    def parse(self, source, atoms=None):
+        self._atoms = 0
+        self._bytes = 0
+        self._start = time()
+        self._moov  = False
+
+        stream = source if isinstance(source, Stream) else Stream(source)
+        if atoms is None:
+            self.index = AtomIndex()
+            atoms = self._parse(stream, stream.end())
+        #
+        else:
+            self.index = atoms
+            atoms = self._indexed(stream, atoms)
+        #
         try:
-            while offset < end:
-                fd.seek(offset)
-                size = unpack('!I', fd.read(4))[0]
-                tag = fd.read(4)
-
-                if size == 1: # if size is too big for a uint32
-                    size = unpack('!Q', fd.read(8))[0] - 8
-                    offset += 8
+            for tag, data in atoms:
+                try: values = self._save(tag, data)
+                except Exception as e:
+                    raise TagError(f'{type(e).__name__}: {e}', tag=tag, size=len(data)) from e
                 #
+                for item in values.items(): yield item
+            #
+        #
+        except ParseError as e:
+            e.filename = e.filename or getattr(source, 'name', None)
+            raise
+        #
+    # end parse
 
-                if tag in Mp4Parser.CONTAINERS:
-                    skip = 12 if tag == b'meta' else 8
-                    for atom in self._parse(fd, offset+skip, offset+size):
-                        yield atom
-                    #
+    #----------------------------------------------------------------------------------------------
+    # @brief Parse the atoms from the current position of the stream.
+    # @param stream - stream positioned at the first atom
+    # @param end - ending offset not to exceed, None to read until the end of the stream
+    # @param depth - nesting level of the containers being parsed
+    # @param parent - index entry of the container being parsed
+    # @yields a tuple(tag, data)
+    # @throws ParseError (or a subclass) if the data is corrupt or exceeds a limit
+    def _parse(self, stream, end, depth=0, parent=-1):
+        offset = stream.tell()
+        self._limit(DepthLimitError, 'depth', depth, offset=offset)
+        while end is None or offset < end:
+            self._atoms += 1
+            self._limit(AtomLimitError, 'atoms', self._atoms, offset=offset)
+            self._limit(TimeLimitError, 'seconds', round(time() - self._start, 3), offset=offset)
+
+            # a few stray bytes after the meta data (moov) are harmless, like cut short media data
+            data = self._read(stream, 8, offset, optional=end is None or self._moov)
+            if not data: break # end of the stream
+            if len(data) < 8:
+                if self._moov: break
+                raise TruncatedError(f'expected 8 bytes, read {len(data)}', offset=offset)
+            #
+            size, tag = unpack('!I4s', data)
+            header = 8
+            if size == 1: # if size is too big for a uint32
+                size = unpack('!Q', self._read(stream, 8, offset, tag))[0]
+                header = 16
+            #
+            elif size == 0: # atom extends to the end of the file (or its container)
+                size = end - offset if end is not None else None
+            #
+
+            if size is not None and size < header:
+                raise AtomSizeError('atom smaller than its header', tag, offset, size)
+            #
+            if end is not None and offset + size > end:
+                # media data is frequently cut short by an incomplete copy, which is harmless once
+                # the meta data (moov) was read, otherwise the meta data is lost with it
+                if tag in Mp4Parser.IGNORE and self._moov: break
+                raise AtomSizeError(f'atom exceeds its container (ends at {end})', tag, offset, size)
+            #
+            entry = len(self.index)
+            self.index.append((parent, offset, size or 0, header, tag))
+
+            if tag in Mp4Parser.CONTAINERS:
+                if tag == b'meta': self._read(stream, 4, offset, tag) # version and flags
+                for atom in self._parse(stream, offset+size if size else None, depth+1, entry):
+                    yield atom
                 #
-                elif not tag in Mp4Parser.IGNORE:
-                    data = fd.read(size-8)
-                    yield tag, data
+                if tag == b'moov': self._moov = True
+            #
+            elif not tag in Mp4Parser.IGNORE:
+                if size is None:
+                    raise AtomSizeError('atom extends to the end of an unbounded stream', tag, offset)
                 #
-                offset += size
+                self._limit(PayloadLimitError, 'payload', size-header, tag=tag, offset=offset, size=size)
+                data = self._read(stream, size-header, offset, tag)
+                yield tag, data
             #
-        #
-        except:
-            pos = fd.tell()
-            fd.seek(0, os.SEEK_END)
-            fsize = fd.tell()
+            if size is None: break # the atom extended to the end of the stream
 
-            print(f'File size: {fsize}')
-            print(f'File position: {pos}')
-            print(f'Range: {begin} -> {end}')
-            print(f'Tag: {tag}')
-            print(f'Offset: {offset}')
-            print(f'Size: {size}')
+            # move to the next atom, discarding anything that was not read
+            remaining = offset + size - stream.tell()
+            if remaining > 0 and self._skip(stream, remaining, offset, tag) < remaining:
+                if tag in Mp4Parser.IGNORE and self._moov: break # see above, cut short media data
+                raise TruncatedError('stream ended inside the atom', tag, offset, size)
+            #
+            offset += size
         #
     # end _parse
 
+    #----------------------------------------------------------------------------------------------
+    # @brief Read the tags listed in an index of the file, without walking the containers.
+    # @param stream - seekable stream of the file
+    # @param atoms - index of the file
+    # @yields a tuple(tag, data)
+    # @throws ParseError (or a subclass) if the data is corrupt or exceeds a limit
+    def _indexed(self, stream, atoms):
+        for _, offset, size, header, tag in atoms:
+            if tag in Mp4Parser.CONTAINERS or tag in Mp4Parser.IGNORE: continue
+            self._limit(TimeLimitError, 'seconds', round(time() - self._start, 3), offset=offset)
+            self._limit(PayloadLimitError, 'payload', size-header, tag=tag, offset=offset, size=size)
+            stream.skip(offset + header - stream.tell())
+            yield tag, self._read(stream, size-header, offset, tag)
+        #
+    # end _indexed
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Read bytes from the stream while enforcing the read budget.
+    # Note: bytes that are skipped (such as the media data) do not count towards the budget
+    # @param stream - stream to read from
+    # @param count - number of bytes to read
+    # @param offset - offset of the atom being read (for error details)
+    # @param tag - tag of the atom being read (for error details)
+    # @param optional - True if reaching the end of the stream is allowed (returns what was read)
+    # @return the bytes read
+    # @throws ReadLimitError if the read budget is exceeded, TruncatedError on a short read
+    def _read(self, stream, count, offset, tag=None, optional=False):
+        self._bytes += count
+        self._limit(ReadLimitError, 'bytes', self._bytes, tag=tag, offset=offset)
+        data = stream.read(count)
+        if len(data) < count and not optional:
+            raise TruncatedError(f'expected {count} bytes, read {len(data)}', tag, offset)
+        #
+        return data
+    # end _read
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Skip bytes of the stream while enforcing the time budget.
+    # Note: a non-seekable stream is discarded chunk by chunk, checking the time after each chunk,
+    #       since a huge (or endless) media data atom on a slow source could otherwise take forever
+    # @param stream - stream to skip
+    # @param count - number of bytes to skip
+    # @param offset - offset of the atom being skipped (for error details)
+    # @param tag - tag of the atom being skipped (for error details)
+    # @return the number of bytes skipped, less than requested at the end of the stream
+    # @throws TimeLimitError if the time budget is exceeded
+    def _skip(self, stream, count, offset, tag):
+        if stream.seekable(): return stream.skip(count)
+
+        skipped = 0
+        while skipped < count:
+            part = stream.skip(min(count - skipped, Stream.CHUNK))
+            if not part: break # end of the stream
+            skipped += part
+            self._limit(TimeLimitError, 'seconds', round(time() - self._start, 3), tag=tag, offset=offset)
+        #
+        return skipped
+    # end _skip
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Check a value against one of the configured limits.
+    # @param error - LimitError subclass to raise
+    # @param name - name of the limit
+    # @param value - current value
+    # @param kwargs - atom details for the error
+    # @throws error if the value exceeds the limit
+    def _limit(self, error, name, value, **kwargs):
+        limit = self._limits[name]
+        if limit is not None and value > limit: raise error(name, limit, value, **kwargs)
+    # end _limit
+
     #----------------------------------------------------------------------------------------------
     # @brief Save an atom from the raw key/value pair.
     # @param tag - name of the parsed tag
     # @param value - value of the parsed tag
+    # @return dictionary of the converted values that were saved
     def _save(self, tag, value):
         # special case tag to save extra meta data (converts to another tag)
         if tag == b'----': 
@@ -178,6 +684,10 @@ class Mp4Parser(dict):
             # convert a comma delimited list to Python list
             value = value[16:].decode('utf-8').split(', ')
         #
+        elif tag == b'covr':
+            # keep the image data as is, even when it happens to decode as text
+            value = value[16:]
+        #
         elif tag in [b'cnID', b'tves', b'tvsn']:
             # convert from binary integer to Python integer
             value = int.from_bytes(value[16:], byteorder='big')
@@ -335,9 +845,10 @@ class Mp4Parser(dict):
         #
 
         # add the parsed data into the dictionary
+        values = {}
         if value:
-            if not isinstance(value, dict): value = { key: value }
-            for key, value in value.items():
+            values = value if isinstance(value, dict) else { key: value }
+            for key, value in values.items():
                 if key in self:
                     if isinstance(self[key], list): self[key].append(value)
                     else: self[key] = [self[key], value]
@@ -347,6 +858,7 @@ class Mp4Parser(dict):
                 #
             #
         #
+        return values
     # end _save
 # end Mp4Parser
 
@@ -364,6 +876,486 @@ def date2int(date):
     #
 # end date2int
 
+#--------------------------------------------------------------------------------------------------
+# @brief Optional SQLite catalog of the scanned movies and TV seasons for the web script.
+# Rows are upserted so repeated scans only modify what actually changed, and the work is committed
+# in batches to keep the number of transactions (and disk syncs) low during a scan.
+class Catalog(object):
+    #----------------------------------------------------------------------------------------------
+    # @brief Number of modified entries per transaction.
+    BATCH = 500
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Tables and indexes; cast and genres are shared by movies and seasons through the ID.
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS movies (
+            id        TEXT PRIMARY KEY,
+            title     TEXT COLLATE NOCASE,
+            released  TEXT,
+            rating    TEXT,
+            width     INTEGER,
+            height    INTEGER,
+            duration  REAL,
+            directors TEXT,
+            path      TEXT );
+        CREATE TABLE IF NOT EXISTS seasons (
+            id        TEXT PRIMARY KEY,
+            title     TEXT COLLATE NOCASE,
+            season    INTEGER,
+            released  TEXT,
+            rating    TEXT,
+            width     INTEGER,
+            height    INTEGER,
+            duration  REAL,
+            station   TEXT );
+        CREATE TABLE IF NOT EXISTS episodes (
+            season    TEXT,
+            episode   INTEGER,
+            title     TEXT,
+            duration  REAL,
+            released  TEXT,
+            PRIMARY KEY (season, episode) ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS cast_members (
+            id        TEXT,
+            name      TEXT COLLATE NOCASE,
+            rank      INTEGER,
+            PRIMARY KEY (id, name) ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS genres (
+            id        TEXT,
+            name      TEXT COLLATE NOCASE,
+            rank      INTEGER,
+            PRIMARY KEY (id, name) ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS movies_title        ON movies (title);
+        CREATE INDEX IF NOT EXISTS movies_released     ON movies (released);
+        CREATE INDEX IF NOT EXISTS movies_resolution   ON movies (height, width);
+        CREATE INDEX IF NOT EXISTS seasons_title       ON seasons (title);
+        CREATE INDEX IF NOT EXISTS seasons_released    ON seasons (released);
+        CREATE INDEX IF NOT EXISTS seasons_resolution  ON seasons (height, width);
+        CREATE INDEX IF NOT EXISTS episodes_released   ON episodes (released);
+        CREATE INDEX IF NOT EXISTS cast_members_name   ON cast_members (name);
+        CREATE INDEX IF NOT EXISTS genres_name         ON genres (name);
+    '''
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Open (or create) a catalog database.
+    # @param filename - path of the SQLite database
+    # @param batch - number of modified entries per transaction
+    def __init__(self, filename, batch=BATCH):
+        self._db      = sqlite3.connect(filename)
+        self._batch   = batch
+        self._pending = 0 # entries modified in the open transaction
+        self._db.executescript(Catalog.SCHEMA)
+    # end constructor
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Insert or update a movie entry as created by the worker.
+    # @param entry - movie details dictionary
+    def movie(self, entry):
+        row = (entry['ID'], Catalog._scalar(entry['Title']), Catalog._scalar(entry['Released']),
+               Catalog._scalar(entry['Rating']), Catalog._integer(entry['Width']),
+               Catalog._integer(entry['Height']), Catalog._real(entry['Duration']),
+               json.dumps(entry['Directors']), entry['Path'])
+        changed  = self._upsert('movies', ['id', 'title', 'released', 'rating', 'width', 'height',
+                                           'duration', 'directors', 'path'], row)
+        changed |= self._links('cast_members', entry['ID'], entry['Cast'])
+        changed |= self._links('genres', entry['ID'], entry['Genre'])
+        if changed: self._modified()
+    # end movie
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Insert or update a TV season entry (with its episodes) as created by the worker.
+    # @param entry - TV season details dictionary
+    def season(self, entry):
+        id  = entry['ID']
+        row = (id, Catalog._scalar(entry['Title']), Catalog._integer(entry['Season']),
+               Catalog._scalar(entry['Released']), Catalog._scalar(entry['Rating']),
+               Catalog._integer(entry['Width']), Catalog._integer(entry['Height']),
+               Catalog._real(entry['Duration']), Catalog._scalar(entry['TV station']))
+        changed  = self._upsert('seasons', ['id', 'title', 'season', 'released', 'rating', 'width',
+                                            'height', 'duration', 'station'], row)
+        changed |= self._links('cast_members', id, entry['Cast'])
+        changed |= self._links('genres', id, entry['Genre'])
+
+        # remove episodes that no longer exist, then update the rest
+        episodes = entry['Episodes']
+        stale = [(id, x[0]) for x in self._db.execute('SELECT episode FROM episodes WHERE season = ?', (id,))
+                 if x[0] not in episodes]
+        if stale:
+            self._db.executemany('DELETE FROM episodes WHERE season = ? AND episode = ?', stale)
+            changed = True
+        #
+        for episode, details in episodes.items():
+            row = (id, episode, Catalog._scalar(details['Title']), Catalog._real(details['Duration']),
+                   Catalog._scalar(details['Released']))
+            changed |= self._upsert('episodes', ['season', 'episode', 'title', 'duration', 'released'],
+                                    row, keys=2)
+        #
+        if changed: self._modified()
+    # end season
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Remove movies and seasons that were not found by a complete scan.
+    # @param movies - IDs of the movies to keep
+    # @param seasons - IDs of the seasons to keep
+    def prune(self, movies, seasons):
+        for table, keep in [('movies', movies), ('seasons', seasons)]:
+            stale = [x for x in self._db.execute(f'SELECT id FROM {table}') if x[0] not in keep]
+            if not stale: continue
+            self._db.executemany(f'DELETE FROM {table} WHERE id = ?', stale)
+            self._db.executemany('DELETE FROM cast_members WHERE id = ?', stale)
+            self._db.executemany('DELETE FROM genres WHERE id = ?', stale)
+            if table == 'seasons': self._db.executemany('DELETE FROM episodes WHERE season = ?', stale)
+            self._modified()
+        #
+    # end prune
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Commit the pending changes and close the database.
+    def close(self):
+        self._db.commit()
+        self._db.close()
+    # end close
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Insert a row, or update it only when one of the values differs.
+    # @param table - name of the table
+    # @param columns - list of column names, starting with the primary key columns
+    # @param row - values for the columns
+    # @param keys - number of leading columns that make up the primary key
+    # @return True if a row was inserted or updated
+    def _upsert(self, table, columns, row, keys=1):
+        values = columns[keys:]
+        sql = 'INSERT INTO {0} ({1}) VALUES ({2}) ON CONFLICT ({3}) DO UPDATE SET {4} ' \
+              'WHERE ({5}) IS NOT ({6})'.format(
+                  table, ', '.join(columns), ', '.join('?' * len(columns)), ', '.join(columns[:keys]),
+                  ', '.join(f'{x} = excluded.{x}' for x in values),
+                  ', '.join(f'{table}.{x}' for x in values), ', '.join(f'excluded.{x}' for x in values))
+        return self._db.execute(sql, row).rowcount > 0
+    # end _upsert
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Replace the names linked to an ID (cast or genres) if the ordered list changed.
+    # @param table - name of the link table
+    # @param id - movie or season ID
+    # @param names - ordered list of names
+    # @return True if the links were rewritten
+    def _links(self, table, id, names):
+        if not isinstance(names, list): names = [names] if names else []
+        names = list(dict.fromkeys(Catalog._scalar(x) for x in names if x)) # unique, keep order
+        current = [x[0] for x in self._db.execute(f'SELECT name FROM {table} WHERE id = ? ORDER BY rank', (id,))]
+        if current == names: return False
+
+        self._db.execute(f'DELETE FROM {table} WHERE id = ?', (id,))
+        self._db.executemany(f'INSERT OR IGNORE INTO {table} (id, name, rank) VALUES (?, ?, ?)',
+                             [(id, name, rank) for rank, name in enumerate(names)])
+        return True
+    # end _links
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Count a modified entry and commit once a batch is complete.
+    def _modified(self):
+        self._pending += 1
+        if self._pending >= self._batch:
+            self._db.commit()
+            self._pending = 0
+        #
+    # end _modified
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Convert a parsed value (possibly a list of duplicate tags) to a single value.
+    @staticmethod
+    def _scalar(value):
+        if isinstance(value, list): value = value[0] if value else None
+        return value if value != '' else None
+    # end _scalar
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Convert a parsed value to an integer, None if not available.
+    @staticmethod
+    def _integer(value):
+        try: return int(Catalog._scalar(value))
+        except: return None
+    # end _integer
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Convert a parsed value to a real number, None if not available.
+    @staticmethod
+    def _real(value):
+        try: return float(Catalog._scalar(value))
+        except: return None
+    # end _real
+# end Catalog
+
+#--------------------------------------------------------------------------------------------------
+# @brief Order files by their physical location on disk and prefetch the upcoming ones.
+# Processing in disk order keeps a spinning disk (or a network file server) reading sequentially
+# instead of seeking between files, while the read ahead hints let the next files load while the
+# current one is parsed. The meta data lives at the start (fast start) or the end of the file, so
+# only those regions are hinted.
+class Scheduler(object):
+    #----------------------------------------------------------------------------------------------
+    # @brief Number of files ahead of the current one to prefetch.
+    LOOKAHEAD = 4
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Size of the regions to prefetch at the start and end of each file [bytes].
+    WINDOW = 1024 * 1024
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Number of files located between progress updates.
+    PROGRESS = 100
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Linux ioctl to map the extents of a file (FS_IOC_FIEMAP).
+    FIEMAP = 0xC020660B
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Construct a schedule for a list of files.
+    # @param files - list of filenames
+    # @param lookahead - number of files to prefetch
+    # @param progress - optional function(located, total) called while locating the files, which
+    #                   returns True to stop locating
+    def __init__(self, files, lookahead=LOOKAHEAD, progress=None):
+        self._files     = files
+        self._lookahead = lookahead
+        keys = []
+        for index, file in enumerate(files):
+            if progress and index % Scheduler.PROGRESS == 0 and progress(index, len(files)): break
+            keys.append((Scheduler.locate(file), index))
+        #
+
+        # files that were not located (when stopped) keep their order after the located ones
+        self._order = [index for _, index in sorted(keys)] + list(range(len(keys), len(files)))
+    # end constructor
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Number of files in the schedule.
+    def __len__(self):
+        return len(self._order)
+    # end __len__
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Iterate the files in disk order, prefetching the files coming up.
+    # @yields a tuple(index in the original list, filename)
+    def __iter__(self):
+        for i in range(min(self._lookahead, len(self._order))):
+            Scheduler.prefetch(self._files[self._order[i]])
+        #
+        for i, index in enumerate(self._order):
+            if i + self._lookahead < len(self._order):
+                Scheduler.prefetch(self._files[self._order[i + self._lookahead]])
+            #
+            yield index, self._files[index]
+        #
+    # end __iter__
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Determine a sort key for the physical location of a file.
+    # @param filename - file to locate
+    # @return tuple(device, 0, physical offset) if the extents can be mapped, otherwise
+    #         tuple(device, 1, inode number), which usually follows the allocation order
+    @staticmethod
+    def locate(filename):
+        try:
+            stat = os.stat(filename)
+        #
+        except OSError:
+            return (0, 2, 0)
+        #
+
+        if fcntl:
+            try:
+                # struct fiemap (32 bytes) followed by a single struct fiemap_extent (56 bytes)
+                request = bytearray(pack('=QQIIII', 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(56))
+                with open(filename, 'rb') as fd: fcntl.ioctl(fd, Scheduler.FIEMAP, request)
+                if unpack('=I', request[20:24])[0]: # mapped extents
+                    return (stat.st_dev, 0, unpack('=Q', request[40:48])[0])
+                #
+            #
+            except OSError:
+                pass
+            #
+        #
+        return (stat.st_dev, 1, stat.st_ino)
+    # end locate
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Hint the operating system to read the meta data regions of a file in the background.
+    # @param filename - file to prefetch
+    # @param window - size of the regions at the start and end of the file [bytes]
+    @staticmethod
+    def prefetch(filename, window=WINDOW):
+        if not hasattr(os, 'posix_fadvise'): return
+        try:
+            fd = os.open(filename, os.O_RDONLY)
+            try:
+                size = os.fstat(fd).st_size
+                os.posix_fadvise(fd, 0, min(size, window), os.POSIX_FADV_WILLNEED)
+                if size > window:
+                    tail = max(window, size - window)
+                    os.posix_fadvise(fd, tail, size - tail, os.POSIX_FADV_WILLNEED)
+                #
+            #
+            finally:
+                os.close(fd)
+            #
+        #
+        except OSError:
+            pass
+        #
+    # end prefetch
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Drop the cached data of a file, so reading it again has to go to the disk.
+    # Note: only the file data is dropped, the file system meta data may remain cached
+    # @param filename - file to evict from the cache
+    @staticmethod
+    def evict(filename):
+        if not hasattr(os, 'posix_fadvise'): return
+        try:
+            fd = os.open(filename, os.O_RDONLY)
+            try: os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally: os.close(fd)
+        #
+        except OSError:
+            pass
+        #
+    # end evict
+# end Scheduler
+
+#--------------------------------------------------------------------------------------------------
+# @brief Writer for the output files that only replaces files whose content changed.
+# Unchanged files are left alone so backups and mirrors do not see them as modified, and changed
+# files are written to temporary files that are synced to disk and renamed over the originals
+# together when closed, so an interrupted run never leaves a partially written file behind.
+# The temporary files are kept in a staging directory that is emptied when the next writer opens
+# the directory, so a killed run does not leave them behind for good.
+class Output(object):
+    #----------------------------------------------------------------------------------------------
+    # @brief Directory for the temporary files, relative to the output directory.
+    STAGING = '.staging'
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Construct a writer for a directory, removing what an interrupted run left behind.
+    # @param directory - directory the filenames are relative to
+    def __init__(self, directory='.'):
+        self._directory = directory
+        self._staging   = os.path.join(directory, Output.STAGING)
+        self._pending   = {} # final path -> temporary file written but not yet synced and renamed
+        self._temps     = 0  # number of temporary files created (to name them)
+        self.written    = 0  # number of files written
+        self.skipped    = 0  # number of files skipped because they did not change
+
+        if os.path.isdir(self._staging):
+            for name in os.listdir(self._staging): os.remove(os.path.join(self._staging, name))
+        #
+    # end constructor
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Write a file if its content changed.
+    # @param filename - name of the file relative to the directory
+    # @param data - bytes to write, or text to write the same as a file opened in text mode
+    # @return True if the file was written, False if it was unchanged
+    def write(self, filename, data):
+        if isinstance(data, str): data = data.replace('\n', os.linesep).encode('utf-8')
+        path = os.path.join(self._directory, filename)
+        self._discard(path) # a later write of the same file replaces the earlier one
+        if Output._unchanged(path, data):
+            self.skipped += 1
+            return False
+        #
+
+        os.makedirs(self._staging, exist_ok=True)
+        self._temps += 1
+        temp = os.path.join(self._staging, f'{self._temps}.tmp')
+        with open(temp, 'wb') as fd: fd.write(data)
+        self._pending[path] = temp
+        self.written += 1
+        return True
+    # end write
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Copy a file if its content changed.
+    # @param source - file to copy
+    # @param filename - name of the destination relative to the directory
+    # @return True if the file was written, False if it was unchanged
+    def copy(self, source, filename):
+        with open(source, 'rb') as fd: return self.write(filename, fd.read())
+    # end copy
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Remove a file if it exists.
+    # @param filename - name of the file relative to the directory
+    def remove(self, filename):
+        path = os.path.join(self._directory, filename)
+        self._discard(path)
+        if os.path.exists(path): os.remove(path)
+    # end remove
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Drop a pending write of a file so it is neither renamed nor counted.
+    # @param path - final path of the file
+    def _discard(self, path):
+        temp = self._pending.pop(path, None)
+        if temp is None: return
+        os.remove(temp)
+        self.written -= 1
+    # end _discard
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Sync the written files to disk, rename them into place and sync the directories.
+    def close(self):
+        # sync every temporary file before any rename, so a crash never leaves a renamed file
+        # whose content did not reach the disk
+        for temp in self._pending.values(): Output._sync(temp, os.O_RDWR)
+
+        directories = set()
+        for path, temp in self._pending.items():
+            os.replace(temp, path)
+            directories.add(os.path.dirname(path) or '.')
+        #
+
+        # the renames are only durable once the directory is synced (not possible on Windows)
+        if os.name == 'posix':
+            for directory in directories: Output._sync(directory, os.O_RDONLY)
+        #
+        self._pending = {}
+        if os.path.isdir(self._staging): os.rmdir(self._staging) # empty once everything is renamed
+    # end close
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Compare the content hash of an existing file to new data.
+    # @param path - file to compare
+    # @param data - new content
+    # @return True if the file exists with the same content
+    @staticmethod
+    def _unchanged(path, data):
+        try:
+            if os.path.getsize(path) != len(data): return False
+            with open(path, 'rb') as fd: return md5(fd.read()).digest() == md5(data).digest()
+        #
+        except OSError:
+            return False
+        #
+    # end _unchanged
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Flush a file or directory to disk.
+    # @param path - file or directory to sync
+    # @param flags - flags to open the path with
+    @staticmethod
+    def _sync(path, flags):
+        try:
+            fd = os.open(path, flags)
+            try: os.fsync(fd)
+            finally: os.close(fd)
+        #
+        except OSError:
+            pass
+        #
+    # end _sync
+# end Output
+
 #--------------------------------------------------------------------------------------------------
 # @brief Main thread for scanning media files and logging the results.
 class Worker(QThread):
@@ -372,54 +1364,108 @@ class Worker(QThread):
     criticalError = pyqtSignal(str) # error text
     complete      = pyqtSignal()
 
+    #----------------------------------------------------------------------------------------------
+    # @brief Fields of the first episode that describe the whole TV season.
+    TV_FIELDS = ['Rating', 'Width', 'Height', 'Released', 'TV station']
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Directory for the partial results of a shard (shard, count).
+    SHARD = '.shard-{0}-of-{1}'
+
     #----------------------------------------------------------------------------------------------
     # @brief Contruct a worker thread to scan a directory recursively and process media files.
     # @param directory - top most directory to scan for media files
-    def __init__(self, directory):
+    # @param database - optional SQLite catalog to update with the results
+    # @param limits - optional parser limits overriding Mp4Parser.LIMITS
+    # @param order - 'locality' to process files in disk order, 'walk' for the directory order
+    # @param shard - optional tuple(shard, count) to only process part of the library (see merge)
+    # @param index - optional directory to keep the atom index of each file in (see AtomIndex)
+    # @param cold - True to drop the files from the cache first, so throughputs are comparable
+    def __init__(self, directory, database=None, limits=None, order='locality', shard=None,
+                 index=None, cold=False):
         super(Worker, self).__init__()
         self._paused    = False
         self._stopped   = False
         self._directory = directory
+        self._database  = database
+        self._limits    = limits
+        self._order     = order
+        self._shard     = shard
+        self._index     = index
+        self._cold      = cold
+        self._target    = '.' # directory for the results (a shard has its own)
     # end constructor
 
     #----------------------------------------------------------------------------------------------
     # @brief Main run method for a QThread.
     def run(self):
-        unique = lambda x: list(set(x))
         directory = self._directory
 
         # scan for a list of videos
+        # Note: the walk is sorted so the position of each file (used to resolve duplicates) does
+        #       not depend on the file system or the order the files are processed in
         basename = os.path.basename(directory) or directory
         title = f'Scanning <a href="file:///{directory}">{basename}</a> for media files'
         self.titleChanged.emit(title)
         videos = []
         for root, directories, filenames in os.walk(directory):
+            directories.sort()
             if r'\$RECYCLE.BIN' in root: continue
-            for filename in filenames:
+            for filename in sorted(filenames):
                 ext = os.path.splitext(filename)[1].lower()
                 if ext in ['.mp4', '.m4a']: videos.append(os.path.join(root, filename))
             #
         #
 
+        # only keep the part of the library for this shard, the positions remain library wide
+        indices = list(range(len(videos)))
+        target  = '.' # directory for the results
+        if self._shard:
+            shard, count = self._shard
+            indices = [i for i in indices if Worker._shardOf(directory, videos[i], count) == shard]
+            target  = Worker.SHARD.format(shard, count)
+        #
+        self._target = target
+        files  = [videos[i] for i in indices]
+        output = Output(target)
+
         # setup before parsing
-        total = len(videos)
+        total = len(files)
         title = f'Processing {total:,} files from <a href="file:///{directory}">{basename}</a>'
         self.titleChanged.emit(title)
 
         for d in ['covers', 'desc']:
-            if not os.path.exists(d): os.mkdir(d)
+            os.makedirs(os.path.join(target, d), exist_ok=True)
         #
+        if self._index: os.makedirs(self._index, exist_ok=True)
 
-        tvFields    = ['Rating', 'Width', 'Height', 'Released', 'TV station']
         movieFields = ['Title', 'Directors', 'Cast', 'Genre', 'Rating', 'Width', 'Height',
                        'Duration', 'Released']
 
-        movies = {} # unique key -> details dictionary
-        tv     = {} # unique key -> details dictionary
+        movies  = {} # unique key -> tuple(index, details dictionary)
+        tv      = {} # unique key -> list of tuple(index, episode dictionary)
+        written = {} # cover/description filename -> rank of the file it was saved from
+        errors  = [] # details of the files that could not be parsed
+
+        # start from a cold cache so the throughput of the file orders can be compared
+        if self._cold:
+            for i, file in enumerate(files):
+                if i % Scheduler.PROGRESS == 0 and self._progress(i, total, 'Dropping cached files'): break
+                Scheduler.evict(file)
+            #
+        #
+
+        catalog  = Catalog(self._database) if self._database and not self._shard else None
+        began    = time()
+        locating = lambda done, total: self._progress(done, total, 'Locating files on disk')
+        schedule = Scheduler(files, progress=locating) if self._order == 'locality' else enumerate(files)
+        overhead = time() - began # time to schedule the files [seconds]
 
         # process the data files
         start = time()
-        for i, file in enumerate(videos):
+        processed = 0
+        for i, (index, file) in enumerate(schedule):
+            index = indices[index]
             if self._stopped: break
             if self._paused:
                 correction = time()
@@ -431,75 +1477,70 @@ class Worker(QThread):
             elapsed   = time() - start
             remaining = ((total * elapsed) / i) - elapsed if i > 0 else -1 # -1 is unknown
             self.statusUpdate.emit(i, total, os.path.basename(file), remaining)
+            processed += 1
 
             # process the file
             try:
-                r = Mp4Parser(file)
+                sidecar = AtomIndex.sidecar(file, self._index) if self._index else None
+                r = Mp4Parser(file, self._limits, sidecar)
+
+                # decode the cover art up front, so a bad image is recorded for every file that
+                # has one, not only for the files that happen to be processed before a better one
+                thumbnail = None
+                if 'Cover' in r:
+                    try: thumbnail = Worker._thumbnail(r.pop('Cover'))
+                    except TagError as e:
+                        e.filename = file
+                        errors.append(e.details())
+                    #
+                #
+
                 cover = None # filename to save cover art if available
                 desc  = None # filename to write the long description
+                rank  = (0, index) # lower ranks take precedence when saving covers/descriptions
 
                 if 'TV show' in r:
                     # Note: {Title} is like an overall title; often one of the following:
                     #       "{TV show}"
                     #       "{TV show} - {Episode title}"
                     #       "{TV show} - s{TV season}e{TV episode} - {Episode title}"
-                    season   = r.get('TV season',  0)
-                    episode  = r.get('TV episode', 0)
-                    released = r.get('Released',   '')
-
-                    key = '{0}: {1}'.format(season, r['TV show'])
-                    if key in tv:
-                        entry = tv[key]
-                    #
-                    else:
-                        id = md5(key.encode('utf-8')).hexdigest()
-
-                        entry = { 'ID':       id,
-                                  'Cover':    0, # episode number used for cover (delete later)
-                                  'Title':    r['TV show'],
-                                  'Season':   season,
-                                  'Released': released,
-                                  'Duration': 0,   # [seconds]
-                                  'Episodes': {},  # episode -> dictionary
-                                  'Genre':    [],  # unique list of genres
-                                  'Cast':     [] } # list of cast (not unique, yet)
-                        for field in tvFields: entry[field] = r.get(field, '')
-
-                        tv[key] = entry
-                    #
+                    episode = Worker._episode(index, r)
+                    key = '{0}: {1}'.format(episode['Season'], episode['Show'])
+                    tv.setdefault(key, []).append((index, episode))
 
                     # this allows covers to be saved for specials, especially when there are only
-                    # specials, but take the cover for an actual episode when available
-                    if not entry['Cover']:
-                        cover = os.path.join('covers', '{0}.jpg'.format(entry['ID']))
-                        entry['Cover'] = episode
-                    #
-
-                    # accumulate details
-                    entry['Duration'] += r.get('Duration', 0)
-                    entry['Genre']     = unique(entry['Genre'] + r.get('Genre', []))
-                    entry['Cast']     += r.get('Cast', [])
-                    entry['Episodes'][episode] = { 'Title':    r.get('Episode title', f'Episode #{episode}'),
-                                                   'Duration': r.get('Duration', 0),
-                                                   'Released': released }
-
-                    # keep the earliest release date for the whole season
-                    if date2int(released) < date2int(entry['Released']):
-                        entry['Released'] = released
-                    #
+                    # specials, but take the cover for the first actual episode when available
+                    id    = md5(key.encode('utf-8')).hexdigest()
+                    cover = os.path.join('covers', f'{id}.jpg')
+                    if not episode['Episode']: rank = (1, -index)
                 #
                 else:
                     # do not show duplicates, which generally happen for the following reasons:
                     # 1. a multidisc set that each have an MP4 file
                     # 2. a alternate ending/extended/director's cut version
+                    # the file found first by the walk is kept, regardless of the processing order
+                    for field in ['Released', 'Title']:
+                        if field not in r: raise MissingTagError(f'{field} tag is missing')
+                    #
                     key = '{0} {1}'.format(r['Released'][0:4], r['Title'])
-                    if key in movies: continue
+                    if key in movies and movies[key][0] < index: continue
 
                     # extract the fields used by the web script
                     id    = md5(key.encode('utf-8')).hexdigest()
                     cover = os.path.join('covers', f'{id}.jpg')
                     desc  = os.path.join('desc', f'{id}.txt')
 
+                    # replace what was saved from a duplicate that was processed earlier, or
+                    # remove it if this file does not have its own
+                    if key in movies:
+                        for filename, value in [(cover, thumbnail), (desc, r.get('Description'))]:
+                            if filename in written:
+                                if not value: output.remove(filename)
+                                del written[filename]
+                            #
+                        #
+                    #
+
                     entry = { 'ID': id }
                     for field in movieFields: entry[field] = r.get(field, '')
 
@@ -514,60 +1555,352 @@ class Worker(QThread):
                         if len(entry[field]) > limit: entry[field] = entry[field][0:limit]
                     #
 
-                    movies[key] = entry
+                    movies[key] = (index, entry)
+                    if catalog: catalog.movie(entry)
                 #
 
                 # save the cover art
-                if cover and 'Cover' in r:
-                    im = Image.open(BytesIO(r['Cover']))
-                    im.thumbnail((400, 400), Image.ANTIALIAS)
-                    im.save(cover, 'JPEG')
-                    del r['Cover']
+                if cover and thumbnail and rank < written.get(cover, (2,)):
+                    output.write(cover, thumbnail)
+                    written[cover] = rank
                 #
 
                 # save the description
-                if desc and 'Description' in r:
+                if desc and 'Description' in r and rank < written.get(desc, (2,)):
                     d = r['Description']
                     if isinstance(d, list): d = max(d, key=len)
-                    with open(desc, 'w', encoding='utf-8') as fd: fd.write(d)
+                    output.write(desc, d)
+                    written[desc] = rank
                 #
             #
+            except ParseError as e:
+                # a corrupt file should not stop the whole scan, just record it
+                e.filename = e.filename or file
+                errors.append(e.details())
+            #
             except Exception as e:
                 _, _, tb = sys.exc_info()
                 msg = '{0}: {1} on line #{2}\nProcessing {3}'.format(type(e).__name__, str(e), tb.tb_lineno, file)
                 self.criticalError.emit(msg)
+                if catalog: catalog.close()
+                output.close()
                 return
             #
         # end for
+        elapsed = time() - start + overhead
+        errors.sort(key=lambda x: x['File'])
+
+        if self._shard:
+            # save everything needed to combine the shards later on
+            library = '\n'.join(Worker._relative(directory, x) for x in videos)
+            partial = { 'Shard':    self._shard,
+                        'Library':  md5(library.encode('utf-8')).hexdigest(), # same for every shard
+                        'Complete': not self._stopped,
+                        'Movies':   movies,
+                        'TV':       tv,
+                        'Written':  written,
+                        'Errors':   errors }
+            output.write('.shard.txt', json.dumps(partial))
+        #
+        elif self._stopped:
+            # partial results would hide the movies and seasons not reached, so keep the last ones
+            if catalog: catalog.close()
+            self._report('Cancelled, the results of the last complete scan were kept')
+        #
+        else:
+            movies, tv = Worker._combine(movies, tv)
+            Worker._publish(movies, tv, errors, catalog, output)
+        #
+        output.close()
+        self._report(f'Wrote {output.written:,} files, skipped {output.skipped:,} unchanged files')
 
-        # select the top 5 most used cast members for an entire season for TV shows
-        # also remove the cover key
-        for entry in tv.values():
-            counts = {} # name -> number of occurances
-            for name in entry['Cast']: counts[name] = counts.get(name, 0) + 1
-            tmp = sorted(counts.items(), key=lambda x: -x[1])
-            cast = [x[0] for x in tmp]
-
-            if len(cast) > 5: cast = cast[0:5]
-            entry['Cast'] = cast
+        if processed and not self._stopped: self._throughput(processed, elapsed)
+        self.complete.emit()
+    # end run
 
-            if 'Cover' in entry: del entry['Cover']
+    #----------------------------------------------------------------------------------------------
+    # @brief Combine the shards of a library scanned with several workers (possibly on several
+    # machines mounting the same library) into the same results as a scan by a single worker.
+    # The shards are processed with --shard i/N and their directories gathered before merging.
+    # @param directories - list of shard directories
+    # @param database - optional SQLite catalog to update with the results
+    # @return summary of the files written, also appended to the scan log
+    # @throws ValueError if the shards are incomplete or do not belong together
+    @staticmethod
+    def merge(directories, database=None):
+        shards = {} # shard number -> tuple(directory, results)
+        for directory in directories:
+            with open(os.path.join(directory, '.shard.txt')) as fd: results = json.load(fd)
+            shard, count = results['Shard']
+            if not results['Complete']: raise ValueError(f'{directory} is incomplete')
+            if shard in shards: raise ValueError(f'{directory} duplicates shard {shard}/{count}')
+            shards[shard] = (directory, results)
         #
 
-        if movies:
-            with open('.movies.txt', 'w') as fd:
-                json.dump(list(movies.values()), fd)
+        counts    = {x['Shard'][1] for _, x in shards.values()}
+        libraries = {x['Library'] for _, x in shards.values()}
+        if len(counts) != 1 or set(shards) != set(range(counts.pop())):
+            raise ValueError('shards are missing or were split differently')
+        #
+        if len(libraries) != 1: raise ValueError('shards were scanned from different libraries')
+
+        # apply the same rules as a single worker: first movie found wins, seasons gather episodes
+        movies  = {} # unique key -> tuple(index, details dictionary)
+        tv      = {} # unique key -> list of tuple(index, episode dictionary)
+        written = {} # cover/description filename -> list of tuple(rank, shard directory)
+        errors  = []
+        for directory, results in shards.values():
+            for key, (index, entry) in results['Movies'].items():
+                if key not in movies or index < movies[key][0]: movies[key] = (index, entry)
             #
+            for key, episodes in results['TV'].items():
+                tv.setdefault(key, []).extend(tuple(x) for x in episodes)
+            #
+            for filename, rank in results['Written'].items():
+                written.setdefault(os.path.normpath(filename), []).append((tuple(rank), directory))
+            #
+            errors += results['Errors']
+        #
+        errors.sort(key=lambda x: x['File'])
+
+        # take each cover/description from the best ranked file; a movie only uses the file that
+        # won, not a duplicate that saved one in another shard
+        winners = { entry['ID']: (0, index) for index, entry in movies.values() }
+        output  = Output()
+        for d in ['covers', 'desc']:
+            if not os.path.exists(d): os.mkdir(d)
+        #
+        for filename, candidates in written.items():
+            id = os.path.splitext(os.path.basename(filename))[0]
+            if id in winners: candidates = [x for x in candidates if x[0] == winners[id]]
+            if not candidates: continue
+            _, directory = min(candidates)
+            output.copy(os.path.join(directory, filename), filename)
+        #
+
+        movies, tv = Worker._combine(movies, tv)
+        catalog = Catalog(database) if database else None
+        if catalog:
+            for entry in movies: catalog.movie(entry)
         #
+        Worker._publish(movies, tv, errors, catalog, output)
+        output.close()
+
+        msg = f'Merged {len(shards)} shards, wrote {output.written:,} files, skipped {output.skipped:,} unchanged files'
+        Worker._log('.', msg)
+        return msg
+    # end merge
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Determine the path of a file within the library, independent of where it is mounted.
+    # @param directory - top most directory of the library
+    # @param filename - file within the library
+    # @return relative path using forward slashes
+    @staticmethod
+    def _relative(directory, filename):
+        return os.path.relpath(filename, directory).replace(os.sep, '/')
+    # end _relative
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Determine the shard a file belongs to from a hash of its path within the library.
+    # @param directory - top most directory of the library
+    # @param filename - file within the library
+    # @param count - number of shards
+    # @return the shard number
+    @staticmethod
+    def _shardOf(directory, filename, count):
+        return int(md5(Worker._relative(directory, filename).encode('utf-8')).hexdigest(), 16) % count
+    # end _shardOf
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Order the movies and build the TV seasons in the order the files were found.
+    # @param movies - dictionary of unique key -> tuple(index, details dictionary)
+    # @param tv - dictionary of unique key -> list of tuple(index, episode dictionary)
+    # @return tuple(list of movies, list of TV seasons)
+    @staticmethod
+    def _combine(movies, tv):
+        movies = [x[1] for x in sorted(movies.values(), key=lambda x: x[0])]
+        tv     = [Worker._season(key, episodes) for key, episodes in
+                  sorted(tv.items(), key=lambda x: min(y[0] for y in x[1]))]
+        return movies, tv
+    # end _combine
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Write the results for the web script.
+    # @param movies - list of movies
+    # @param tv - list of TV seasons
+    # @param errors - list of details of the files that could not be parsed
+    # @param catalog - optional catalog to add the seasons to (the movies are already added), entries
+    #                  no longer in the results are removed from it
+    # @param output - writer for the files
+    @staticmethod
+    def _publish(movies, tv, errors, catalog, output):
+        if catalog:
+            for entry in tv: catalog.season(entry)
+            catalog.prune({x['ID'] for x in movies}, {x['ID'] for x in tv})
+            catalog.close()
+        #
+
+        if movies: output.write('.movies.txt', json.dumps(movies))
+        if tv:     output.write('.tv.txt', json.dumps(tv))
+        if errors: output.write('.errors.txt', json.dumps(errors, indent=1))
+        else:      output.remove('.errors.txt')
+    # end _publish
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Convert cover art to the thumbnail saved for the web script.
+    # @param data - image data of the cover (the first one if a file has several)
+    # @return the JPEG thumbnail
+    # @throws TagError if the image cannot be decoded (corrupt, unknown format or too large)
+    @staticmethod
+    def _thumbnail(data):
+        if isinstance(data, list): data = data[0]
+        try:
+            im = Image.open(BytesIO(data))
+            im.thumbnail((400, 400), Image.LANCZOS)
+            if im.mode not in ['RGB', 'L']: im = im.convert('RGB') # JPEG has no alpha or palette
+            jpeg = BytesIO()
+            im.save(jpeg, 'JPEG')
+        #
+        except Exception as e: # includes Image.DecompressionBombError
+            raise TagError(f'{type(e).__name__}: {e}', tag=b'covr', size=len(data)) from e
+        #
+        return jpeg.getvalue()
+    # end _thumbnail
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Extract the details of a TV episode needed to build its season.
+    # @param index - position of the file in the scan
+    # @param r - parsed meta data of the file
+    # @return dictionary of the episode details
+    @staticmethod
+    def _episode(index, r):
+        episode = { 'Show':          r['TV show'],
+                    'Season':        r.get('TV season',  0),
+                    'Episode':       r.get('TV episode', 0),
+                    'Duration':      r.get('Duration',   0),
+                    'Genre':         r.get('Genre',      []),
+                    'Cast':          r.get('Cast',       []) }
+        episode['Episode title'] = r.get('Episode title', 'Episode #{0}'.format(episode['Episode']))
+        for field in Worker.TV_FIELDS: episode[field] = r.get(field, '')
+        return episode
+    # end _episode
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Combine the episodes of a TV season into a single entry.
+    # @param key - unique key of the season
+    # @param episodes - list of tuple(index, episode dictionary), in any order
+    # @return the season details dictionary
+    @staticmethod
+    def _season(key, episodes):
+        unique = lambda x: list(dict.fromkeys(x))
+        entry  = None
+        for _, r in sorted(episodes, key=lambda x: x[0]):
+            episode  = r['Episode']
+            released = r['Released']
+            if entry is None:
+                entry = { 'ID':       md5(key.encode('utf-8')).hexdigest(),
+                          'Title':    r['Show'],
+                          'Season':   r['Season'],
+                          'Released': released,
+                          'Duration': 0,   # [seconds]
+                          'Episodes': {},  # episode -> dictionary
+                          'Genre':    [],  # unique list of genres
+                          'Cast':     [] } # list of cast (not unique, yet)
+                for field in Worker.TV_FIELDS: entry[field] = r[field]
+            #
 
-        if tv:
-            with open('.tv.txt', 'w') as fd:
-                json.dump(list(tv.values()), fd)
+            # accumulate details
+            entry['Duration'] += r['Duration']
+            entry['Genre']     = unique(entry['Genre'] + r['Genre'])
+            entry['Cast']     += r['Cast']
+            entry['Episodes'][episode] = { 'Title':    r['Episode title'],
+                                           'Duration': r['Duration'],
+                                           'Released': released }
+
+            # keep the earliest release date for the whole season
+            if date2int(released) < date2int(entry['Released']):
+                entry['Released'] = released
             #
         #
 
-        self.complete.emit()
-    # end run
+        # select the top 5 most used cast members for an entire season
+        counts = {} # name -> number of occurances
+        for name in entry['Cast']: counts[name] = counts.get(name, 0) + 1
+        tmp = sorted(counts.items(), key=lambda x: -x[1])
+        cast = [x[0] for x in tmp]
+
+        if len(cast) > 5: cast = cast[0:5]
+        entry['Cast'] = cast
+        return entry
+    # end _season
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Report progress while preparing the files, pausing as requested.
+    # @param done - number of files prepared
+    # @param total - total number of files
+    # @param status - description of the preparation
+    # @return True if the worker was cancelled
+    def _progress(self, done, total, status):
+        while self._paused and not self._stopped: sleep(0.1)
+        self.statusUpdate.emit(done, total, status, -1)
+        return self._stopped
+    # end _progress
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Show a message in the title and append it to the scan log.
+    # @param msg - message to report
+    def _report(self, msg):
+        self.titleChanged.emit(msg)
+        Worker._log(self._target, msg)
+    # end _report
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Append a time stamped message to the scan log of a directory.
+    # @param directory - directory holding the log
+    # @param msg - message to log
+    @staticmethod
+    def _log(directory, msg):
+        with open(os.path.join(directory, '.scan.log'), 'a', encoding='utf-8') as fd:
+            fd.write('{0} {1}\n'.format(strftime('%Y-%m-%d %H:%M:%S'), msg))
+        #
+    # end _log
+
+    #----------------------------------------------------------------------------------------------
+    # @brief Report the throughput of a scan and compare it to the last scan in the other order.
+    # Note: the comparison is only meaningful when both scans start with a cold file cache, so
+    #       scans without --cold are reported as not comparable
+    # @param processed - number of files processed
+    # @param elapsed - time spent processing [seconds]
+    def _throughput(self, processed, elapsed):
+        stats = {} # order -> statistics of the last complete scan
+        try:
+            with open(os.path.join(self._target, '.throughput.txt')) as fd: stats = json.load(fd)
+        #
+        except:
+            pass
+        #
+
+        rate = processed / max(elapsed, 1e-6)
+        stats[self._order] = { 'Files': processed, 'Seconds': elapsed, 'Rate': rate,
+                               'Cold': self._cold }
+        with open(os.path.join(self._target, '.throughput.txt'), 'w') as fd:
+            json.dump(stats, fd, indent=1)
+        #
+
+        msg = f'Processed {processed:,} files in {elapsed:.1f} seconds ' \
+              f'({rate:.1f} files/second in {self._order} order)'
+        for order, other in stats.items():
+            if order == self._order or not other['Rate']: continue
+            if self._cold and other.get('Cold'):
+                msg += f', {rate / other["Rate"]:.2f}x the cold {order} order'
+            #
+            else:
+                msg += f', not comparable to the {order} order (run both with --cold)'
+            #
+        #
+        self._report(msg)
+    # end _throughput
 
     #----------------------------------------------------------------------------------------------
     # @brief Accessor for the paused state.
@@ -600,7 +1933,8 @@ class Worker(QThread):
 class MainWindow(QDialog):
     #----------------------------------------------------------------------------------------------
     # @brief Construct the main GUI window.
-    def __init__(self):        
+    # @param args - parsed command line options
+    def __init__(self, args):
         super(MainWindow, self).__init__()
         self.setWindowTitle('Video meta data extractor')
 
@@ -622,6 +1956,7 @@ class MainWindow(QDialog):
         self._items    = None # items remaining
         self._taskbar  = None # taskbar progress in Windows
         self._thread   = None # worker thread
+        self._args     = args # command line options
 
         # create the main layout
         self.setLayout(QVBoxLayout())
@@ -694,12 +2029,14 @@ class MainWindow(QDialog):
         super(MainWindow, self).show()
 
         # determine the directory to scan
-        directory = QFileDialog.getExistingDirectory(self, 'Select a media directory')
+        directory = self._args.directory
+        if not directory: directory = QFileDialog.getExistingDirectory(self, 'Select a media directory')
         if not directory: self.close()
         directory = os.path.abspath(directory)
 
         # start the thread
-        self._thread = Worker(directory)
+        self._thread = Worker(directory, self._args.database, self._args.limits, self._args.order,
+                              self._args.shard, self._args.index, self._args.cold)
         self._thread.titleChanged.connect(self._title.setText)
         self._thread.statusUpdate.connect(self._update)
         self._thread.criticalError.connect(self._error)
@@ -814,8 +2151,82 @@ class MainWindow(QDialog):
 #--------------------------------------------------------------------------------------------------
 # @brief Main application entry point.
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    main = MainWindow()
+    #----------------------------------------------------------------------------------------------
+    # @brief Convert a shard option (e.g. 0/4) to a tuple(shard, count).
+    def shard(text):
+        try: shard, count = [int(x) for x in text.split('/')]
+        except: raise argparse.ArgumentTypeError(f'expected I/N, not {text}')
+        if not 0 <= shard < count: raise argparse.ArgumentTypeError(f'shard {text} out of range')
+        return shard, count
+    # end shard
+
+    parser = argparse.ArgumentParser(description='Extract meta data from MP4/M4A media files.')
+    parser.add_argument('--database', help='also write the results to a SQLite catalog')
+    parser.add_argument('--order', choices=['locality', 'walk'], default='locality',
+                        help='process files in disk order (default) or directory order')
+    parser.add_argument('--directory', help='media directory to scan instead of asking for one')
+    parser.add_argument('--headless', action='store_true', help='scan --directory without a window')
+    parser.add_argument('--shard', type=shard, metavar='I/N',
+                        help='only process shard I of N, saving partial results for --merge')
+    parser.add_argument('--merge', nargs='+', metavar='DIR',
+                        help='combine the results of the shard directories')
+    parser.add_argument('--index', metavar='DIR',
+                        help='keep an atom index of each file in DIR to skip walking it next time')
+    parser.add_argument('--stream', action='store_true',
+                        help='parse a file piped to stdin and print each tag as a JSON line')
+    parser.add_argument('--cold', action='store_true',
+                        help='drop the files from the cache first to measure cold throughput')
+    parser.add_argument('--max-depth', type=int, help='maximum nesting of container atoms')
+    parser.add_argument('--max-atoms', type=int, help='maximum number of atoms per file')
+    parser.add_argument('--max-payload', type=int, help='maximum size of a single atom [bytes]')
+    parser.add_argument('--max-bytes', type=int, help='maximum bytes read per file [bytes]')
+    parser.add_argument('--max-seconds', type=float, help='maximum time to parse a file [seconds]')
+    args, qtArgs = parser.parse_known_args()
+
+    args.limits = {}
+    for name in Mp4Parser.LIMITS:
+        value = getattr(args, f'max_{name}')
+        if value is not None: args.limits[name] = value if value > 0 else None # 0 disables
+    #
+
+    if args.stream:
+        text = lambda x: x.decode('latin-1') if isinstance(x, bytes) else x
+        try:
+            for key, value in Mp4Parser(limits=args.limits).parse(sys.stdin.buffer):
+                if isinstance(value, bytes): value = f'<{len(value):,} bytes>'
+                print(json.dumps({ text(key): value }), flush=True)
+            #
+        #
+        except ParseError as e:
+            print(json.dumps(e.details()), file=sys.stderr)
+            sys.exit(1)
+        #
+        sys.exit(0)
+    #
+
+    if args.merge:
+        try: print(Worker.merge(args.merge, args.database))
+        except ValueError as e:
+            print(f'Merge failed: {e}', file=sys.stderr)
+            sys.exit(1)
+        #
+        sys.exit(0)
+    #
+
+    if args.headless:
+        if not args.directory: parser.error('--headless requires --directory')
+        failed = []
+        worker = Worker(os.path.abspath(args.directory), args.database, args.limits, args.order,
+                        args.shard, args.index, args.cold)
+        worker.titleChanged.connect(print)
+        worker.criticalError.connect(failed.append)
+        worker.run()
+        for msg in failed: print(msg, file=sys.stderr)
+        sys.exit(1 if failed else 0)
+    #
+
+    app = QApplication(sys.argv[:1] + qtArgs)
+    main = MainWindow(args)
     main.show()
     sys.exit(app.exec_())
 # end main
@@ -0,0 +1,148 @@
+import os
+import sys
+
+from struct import pack
+
+import pytest
+
+pytest.importorskip('PyQt5.QtCore')
+pytest.importorskip('PIL.Image')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Mp4Parser import AtomIndex, Mp4Parser
+
+#--------------------------------------------------------------------------------------------------
+# @brief Build an atom from a tag and its payload.
+def atom(tag, payload):
+    return pack('!I4s', len(payload) + 8, tag) + payload
+# end atom
+
+#--------------------------------------------------------------------------------------------------
+# @brief Build an iTunes data atom holding a value.
+def data(value):
+    return atom(b'data', pack('!II', 1, 0) + value)
+# end data
+
+#--------------------------------------------------------------------------------------------------
+# @brief Write an MP4 file with the meta data after the media data, returning its filename.
+def mp4(tmp_path, tags):
+    ilst = atom(b'ilst', b''.join(atom(tag, data(value)) for tag, value in tags))
+    moov = atom(b'moov', atom(b'udta', atom(b'meta', bytes(4) + ilst)))
+    filename = str(tmp_path / 'movie.mp4')
+    with open(filename, 'wb') as fd:
+        fd.write(atom(b'ftyp', b'M4V ' + bytes(4)) + atom(b'mdat', bytes(4096)) + moov)
+    #
+    return filename
+# end mp4
+
+TAGS = [(b'\xa9nam', b'Title'), (b'\xa9day', b'2001-02-03'), (b'covr', b'\xff\xd8image'),
+        (b'\xa9gen', b'Drama, Comedy')]
+
+#--------------------------------------------------------------------------------------------------
+# @brief A saved index loads back, finds atoms by path and reads their payloads.
+def test_round_trip(tmp_path):
+    filename = mp4(tmp_path, TAGS)
+    sidecar  = AtomIndex.sidecar(filename)
+    parser   = Mp4Parser(filename, index=sidecar)
+    assert os.path.exists(sidecar)
+
+    index = AtomIndex.load(sidecar, filename)
+    assert index == parser.index
+    assert [index.path(i) for i in range(3)] == ['ftyp', 'mdat', 'moov']
+    assert len(index.find('moov/udta/meta/ilst/\xa9nam')) == 1
+    assert index.find('moov/udta/meta/ilst/free') == []
+
+    covers = index.find('moov/udta/meta/ilst/covr')
+    with open(filename, 'rb') as fd: payload = AtomIndex.read(fd, covers[0])
+    assert payload == data(b'\xff\xd8image')
+# end test_round_trip
+
+#--------------------------------------------------------------------------------------------------
+# @brief Sidecars kept in a shared directory are named after the media file.
+def test_sidecar_directory(tmp_path):
+    filename = mp4(tmp_path, TAGS)
+    directory = str(tmp_path / 'index')
+    os.mkdir(directory)
+    sidecar = AtomIndex.sidecar(filename, directory)
+    assert os.path.dirname(sidecar) == directory and sidecar != AtomIndex.sidecar(filename)
+    Mp4Parser(filename, index=sidecar)
+    assert AtomIndex.load(sidecar, filename) is not None
+# end test_sidecar_directory
+
+#--------------------------------------------------------------------------------------------------
+# @brief An indexed parse gives the same results as walking the atoms.
+def test_indexed_parse(tmp_path, monkeypatch):
+    filename = mp4(tmp_path, TAGS)
+    sidecar  = AtomIndex.sidecar(filename)
+    walked   = Mp4Parser(filename, index=sidecar)
+    monkeypatch.setattr(Mp4Parser, '_parse', lambda *args: pytest.fail('walked the atoms'))
+    indexed  = Mp4Parser(filename, index=sidecar)
+    monkeypatch.undo()
+    assert dict(indexed) == dict(walked) == dict(Mp4Parser(filename))
+    assert indexed['Cover'] == b'\xff\xd8image'
+# end test_indexed_parse
+
+#--------------------------------------------------------------------------------------------------
+# @brief An index no longer matching the file (or a damaged sidecar) is not used.
+@pytest.mark.parametrize('change', ['size', 'mtime', 'truncated', 'magic', 'version'])
+def test_rejected(tmp_path, change):
+    filename = mp4(tmp_path, TAGS)
+    sidecar  = AtomIndex.sidecar(filename)
+    Mp4Parser(filename, index=sidecar)
+    assert AtomIndex.load(sidecar, filename) is not None
+
+    stat = os.stat(filename)
+    if change == 'size': # keep the modification time, like a copy preserving it
+        with open(filename, 'ab') as fd: fd.write(atom(b'free', bytes(8)))
+        os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    #
+    elif change == 'mtime':
+        os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    #
+    else:
+        with open(sidecar, 'rb') as fd: content = fd.read()
+        if change == 'truncated': content = content[:-1]
+        if change == 'magic':     content = b'XXXX' + content[4:]
+        if change == 'version':   content = content[:4] + bytes([9]) + content[5:]
+        with open(sidecar, 'wb') as fd: fd.write(content)
+    #
+    assert AtomIndex.load(sidecar, filename) is None
+
+    # the file is walked again and the index replaced
+    assert dict(Mp4Parser(filename, index=sidecar)) == dict(Mp4Parser(filename))
+    assert AtomIndex.load(sidecar, filename) is not None
+# end test_rejected
+
+#--------------------------------------------------------------------------------------------------
+# @brief A missing or empty sidecar is not an index.
+def test_missing(tmp_path):
+    filename = mp4(tmp_path, TAGS)
+    assert AtomIndex.load(str(tmp_path / 'missing.idx'), filename) is None
+    open(str(tmp_path / 'empty.idx'), 'wb').close()
+    assert AtomIndex.load(str(tmp_path / 'empty.idx'), filename) is None
+# end test_missing
+
+#--------------------------------------------------------------------------------------------------
+# @brief A sidecar that cannot be written does not stop the parse.
+def test_save_failure(tmp_path):
+    filename = mp4(tmp_path, TAGS)
+    sidecar  = str(tmp_path / 'missing' / 'movie.idx')
+    assert dict(Mp4Parser(filename, index=sidecar)) == dict(Mp4Parser(filename))
+    assert not os.path.exists(os.path.dirname(sidecar))
+# end test_save_failure
+
+#--------------------------------------------------------------------------------------------------
+# @brief Finding atoms follows changes to the index.
+def test_find_changes():
+    index = AtomIndex([(-1, 0, 24, 8, b'moov'), (0, 8, 16, 8, b'udta')])
+    assert index.find('moov/udta') == [(0, 8, 16, 8, b'udta')]
+    index.append((1, 16, 8, 8, b'free'))
+    assert index.find('moov/udta/free') == [(1, 16, 8, 8, b'free')]
+    index[1] = (0, 8, 16, 8, b'trak')
+    assert index.find('moov/udta') == [] and len(index.find('moov/trak/free')) == 1
+    index.insert(0, (-1, 0, 8, 8, b'ftyp'))
+    index.pop(0)
+    assert index.find('ftyp') == [] and len(index.find('moov/trak')) == 1
+    index.clear()
+    assert index.find('moov') == []
+# end test_find_changes
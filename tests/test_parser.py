@@ -0,0 +1,139 @@
+import os
+import sys
+
+from io     import BytesIO
+from struct import pack
+
+import pytest
+
+pytest.importorskip('PyQt5.QtCore')
+pytest.importorskip('PIL.Image')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Mp4Parser import AtomSizeError, AtomLimitError, DepthLimitError, LimitError, Mp4Parser, \
+                      PayloadLimitError, ReadLimitError, TagError, TimeLimitError, TruncatedError
+
+#--------------------------------------------------------------------------------------------------
+# @brief Build an atom from a tag and its payload (size 0 for an atom extending to the end).
+def atom(tag, payload, size=None):
+    return pack('!I4s', len(payload) + 8 if size is None else size, tag) + payload
+# end atom
+
+#--------------------------------------------------------------------------------------------------
+# @brief Build an iTunes data atom holding a value.
+def data(value):
+    return atom(b'data', pack('!II', 1, 0) + value)
+# end data
+
+#--------------------------------------------------------------------------------------------------
+# @brief Build a movie atom with the meta data tags.
+def moov(*tags):
+    ilst = atom(b'ilst', b''.join(atom(tag, data(value)) for tag, value in tags))
+    return atom(b'moov', atom(b'udta', atom(b'meta', bytes(4) + ilst)))
+# end moov
+
+FTYP  = atom(b'ftyp', b'M4V ' + bytes(4))
+TITLE = (b'\xa9nam', b'Title')
+
+#--------------------------------------------------------------------------------------------------
+# @brief Parse a file held in memory.
+def parse(content, **limits):
+    return dict(Mp4Parser(BytesIO(content), limits))
+# end parse
+
+#--------------------------------------------------------------------------------------------------
+# @brief A size of 0 extends an atom to the end of the file.
+def test_size_zero_top_level():
+    assert parse(FTYP + moov(TITLE) + atom(b'mdat', bytes(64), size=0)) == { 'Title': 'Title' }
+    assert parse(FTYP + pack('!I', 0) + moov(TITLE)[4:]) == { 'Title': 'Title' }
+# end test_size_zero_top_level
+
+#--------------------------------------------------------------------------------------------------
+# @brief A size of 0 extends an atom to the end of its container.
+def test_size_zero_in_container():
+    ilst = atom(b'ilst', atom(b'\xa9day', data(b'2001')) + atom(b'\xa9nam', data(b'Title'), size=0))
+    content = atom(b'moov', atom(b'udta', atom(b'meta', bytes(4) + ilst)))
+    assert parse(FTYP + content + atom(b'free', bytes(8))) == { 'Released': '2001', 'Title': 'Title' }
+# end test_size_zero_in_container
+
+#--------------------------------------------------------------------------------------------------
+# @brief An atom larger than its parent is an error, wherever it is.
+def test_overrun_parent():
+    ilst = atom(b'ilst', atom(b'\xa9nam', data(b'Title'), size=64))
+    content = atom(b'moov', atom(b'udta', atom(b'meta', bytes(4) + ilst)))
+    with pytest.raises(AtomSizeError) as e: parse(FTYP + content + bytes(64))
+    assert e.value.details()['Tag'] == '\xa9nam'
+
+    content = atom(b'moov', atom(b'udta', atom(b'free', bytes(8), size=64)))
+    with pytest.raises(AtomSizeError) as e: parse(FTYP + content + bytes(64))
+    assert e.value.details()['Tag'] == 'free'
+# end test_overrun_parent
+
+#--------------------------------------------------------------------------------------------------
+# @brief Cut short media data loses the meta data after it, but not the meta data before it.
+def test_overrun_media_data():
+    mdat = atom(b'mdat', bytes(64), size=1024)
+    with pytest.raises(AtomSizeError) as e: parse(FTYP + mdat + moov(TITLE))
+    assert e.value.details()['Tag'] == 'mdat'
+    assert parse(FTYP + moov(TITLE) + mdat) == { 'Title': 'Title' }
+# end test_overrun_media_data
+
+#--------------------------------------------------------------------------------------------------
+# @brief A cut short header is an error before the meta data, stray bytes after it are not.
+def test_truncated():
+    with pytest.raises(TruncatedError): parse(FTYP + moov(TITLE)[:3])
+    with pytest.raises(AtomSizeError): parse(FTYP + moov(TITLE)[:-3])
+    assert parse(FTYP + moov(TITLE) + b'abc') == { 'Title': 'Title' }
+# end test_truncated
+
+#--------------------------------------------------------------------------------------------------
+# @brief Each limit raises its own error with the limit and the offending value.
+@pytest.mark.parametrize('error, limits, value', [
+    (DepthLimitError,   { 'depth': 2 },    3),
+    (AtomLimitError,    { 'atoms': 3 },    4),
+    (PayloadLimitError, { 'payload': 8 },  21),
+    (ReadLimitError,    { 'bytes': 20 },   24),
+    (TimeLimitError,    { 'seconds': -1 }, None)])
+def test_limits(error, limits, value):
+    with pytest.raises(error) as e: parse(FTYP + moov(TITLE), **limits)
+    assert isinstance(e.value, LimitError)
+    details = e.value.details()
+    assert details['Error'] == error.__name__
+    assert details['Limit'] == list(limits.values())[0]
+    assert value is None or details['Value'] == value
+    assert details['Offset'] is not None
+# end test_limits
+
+#--------------------------------------------------------------------------------------------------
+# @brief Disabling a limit (None) lets the file through.
+def test_limit_disabled():
+    assert parse(FTYP + moov(TITLE), depth=None, atoms=None) == { 'Title': 'Title' }
+# end test_limit_disabled
+
+#--------------------------------------------------------------------------------------------------
+# @brief A payload that cannot be decoded is wrapped in a TagError with the original cause.
+def test_tag_error():
+    with pytest.raises(TagError) as e: parse(FTYP + moov((b'\xa9ART', b'\xff\xfe')))
+    assert isinstance(e.value.__cause__, UnicodeDecodeError)
+    details = e.value.details()
+    assert details['Tag'] == '\xa9ART'
+    assert details['Reason'].startswith('UnicodeDecodeError')
+
+    with pytest.raises(TagError) as e: parse(FTYP + atom(b'moov', atom(b'mvhd', bytes(8))))
+    assert e.value.details()['Tag'] == 'mvhd'
+# end test_tag_error
+
+#--------------------------------------------------------------------------------------------------
+# @brief Cover art stays binary even when it happens to be valid text.
+def test_cover_bytes():
+    assert parse(FTYP + moov((b'covr', b'not an image'))) == { 'Cover': b'not an image' }
+# end test_cover_bytes
+
+#--------------------------------------------------------------------------------------------------
+# @brief Errors from a file name the file.
+def test_filename(tmp_path):
+    filename = str(tmp_path / 'bad.mp4')
+    with open(filename, 'wb') as fd: fd.write(FTYP + moov(TITLE)[:3])
+    with pytest.raises(TruncatedError) as e: Mp4Parser(filename)
+    assert e.value.details()['File'] == filename
+# end test_filename
@@ -0,0 +1,156 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+from io     import BytesIO
+from struct import pack
+
+import pytest
+
+pytest.importorskip('PyQt5.QtCore')
+Image = pytest.importorskip('PIL.Image')
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Mp4Parser.py')
+SHARDS = 3
+
+#--------------------------------------------------------------------------------------------------
+# @brief Build an atom from a tag and its payload.
+def atom(tag, payload):
+    return pack('!I4s', len(payload) + 8, tag) + payload
+# end atom
+
+#--------------------------------------------------------------------------------------------------
+# @brief Build an iTunes data atom holding a value.
+def data(value):
+    if isinstance(value, int): value = value.to_bytes(4, 'big')
+    return atom(b'data', pack('!II', 1, 0) + value)
+# end data
+
+#--------------------------------------------------------------------------------------------------
+# @brief Build a small JPEG for cover art.
+def jpeg(color):
+    buffer = BytesIO()
+    Image.new('RGB', (16, 16), color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+# end jpeg
+
+#--------------------------------------------------------------------------------------------------
+# @brief Write an MP4 file with the meta data tags (and the meta data after the media data).
+def mp4(filename, tags):
+    ilst = atom(b'ilst', b''.join(atom(tag, data(value)) for tag, value in tags))
+    moov = atom(b'moov', atom(b'udta', atom(b'meta', bytes(4) + ilst)))
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'wb') as fd:
+        fd.write(atom(b'ftyp', b'M4V ' + bytes(4)) + atom(b'mdat', bytes(256)) + moov)
+    #
+# end mp4
+
+#--------------------------------------------------------------------------------------------------
+# @brief Build a library with duplicate movies, TV seasons with specials and a corrupt file.
+def library(root):
+    colors = ['red', 'green', 'blue', 'white', 'black']
+    for i in range(40):
+        tags = [(b'\xa9nam', b'Movie %d' % (i % 10)), (b'\xa9day', b'20%02d-01-01' % (i % 2)),
+                (b'\xa9ART', b'Actor %d, Actor %d' % (i % 5, i % 7)), (b'\xa9gen', b'Drama')]
+        if i % 3: tags.append((b'covr', jpeg(colors[i % 5])))
+        if i % 4: tags.append((b'ldes', b'Description of file %d' % i))
+        mp4(os.path.join(root, f'movies{i % 4}', f'movie{i}.mp4'), tags)
+    #
+    for i in range(30):
+        tags = [(b'tvsh', b'Show %d' % (i % 2)), (b'tvsn', i % 3 + 1), (b'tves', i % 5),
+                (b'tven', b'Episode %d' % i), (b'\xa9day', b'2010-%02d-01' % (i % 9 + 1)),
+                (b'\xa9ART', b'Cast %d, Cast %d' % (i % 4, i % 6)), (b'\xa9gen', b'Genre %d' % (i % 3))]
+        if i % 2: tags.append((b'covr', jpeg(colors[i % 5])))
+        mp4(os.path.join(root, f'tv{i % 3}', f'episode{i}.mp4'), tags)
+    #
+    with open(os.path.join(root, 'movies0', 'corrupt.mp4'), 'wb') as fd:
+        fd.write(atom(b'ftyp', b'M4V ' + bytes(4)) + pack('!I4s', 4, b'moov'))
+    #
+# end library
+
+#--------------------------------------------------------------------------------------------------
+# @brief Run the script and fail if it does not succeed.
+def run(cwd, *args):
+    os.makedirs(cwd, exist_ok=True)
+    subprocess.run([sys.executable, SCRIPT, *args], cwd=cwd, check=True, capture_output=True)
+# end run
+
+#--------------------------------------------------------------------------------------------------
+# @brief Collect the results of a scan: output files and catalog rows.
+def results(directory):
+    files = {}
+    for name in ['.movies.txt', '.tv.txt', '.errors.txt']:
+        with open(os.path.join(directory, name), 'rb') as fd: files[name] = fd.read()
+    #
+    for d in ['covers', 'desc']:
+        for name in os.listdir(os.path.join(directory, d)):
+            with open(os.path.join(directory, d, name), 'rb') as fd: files[f'{d}/{name}'] = fd.read()
+        #
+    #
+
+    db = sqlite3.connect(os.path.join(directory, 'catalog.db'))
+    tables = ['movies', 'seasons', 'episodes', 'cast_members', 'genres']
+    rows = { x: db.execute(f'SELECT * FROM {x} ORDER BY 1, 2').fetchall() for x in tables }
+    db.close()
+    return files, rows
+# end results
+
+#--------------------------------------------------------------------------------------------------
+# @brief Merging the shards of several processes gives the same results as a single scan.
+def test_merge_matches_single(tmp_path):
+    root = str(tmp_path / 'library')
+    library(root)
+
+    single = str(tmp_path / 'single')
+    run(single, '--headless', '--directory', root, '--database', 'catalog.db')
+
+    sharded = str(tmp_path / 'sharded')
+    os.makedirs(sharded)
+    processes = [subprocess.Popen([sys.executable, SCRIPT, '--headless', '--directory', root,
+                                   '--shard', f'{i}/{SHARDS}'], cwd=sharded,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                 for i in range(SHARDS)]
+    assert [x.wait() for x in processes] == [0] * SHARDS
+    run(sharded, '--merge', *[f'.shard-{i}-of-{SHARDS}' for i in range(SHARDS)],
+        '--database', 'catalog.db')
+
+    expected = results(single)
+    assert any(x.startswith('covers/') for x in expected[0])
+    assert any(x.startswith('desc/') for x in expected[0])
+    assert results(sharded) == expected
+# end test_merge_matches_single
+
+#--------------------------------------------------------------------------------------------------
+# @brief Cover art that cannot be decoded is recorded as an error without stopping the scan.
+def test_bad_cover(tmp_path):
+    root = str(tmp_path / 'library')
+    library(root)
+    for name, cover in [(b'Binary', b'\x00\x01garbage'), (b'Text', b'valid UTF-8, not an image')]:
+        tags = [(b'\xa9nam', name), (b'\xa9day', b'2001-01-01'), (b'covr', cover)]
+        mp4(os.path.join(root, 'bad', f'{name.decode().lower()}.mp4'), tags)
+    #
+
+    single = str(tmp_path / 'single')
+    run(single, '--headless', '--directory', root, '--database', 'catalog.db')
+    files, _ = results(single)
+    errors = [x for x in json.loads(files['.errors.txt']) if x['Tag'] == 'covr']
+    assert [(os.path.basename(x['File']), x['Error']) for x in errors] == [('binary.mp4', 'TagError'),
+                                                                          ('text.mp4', 'TagError')]
+    titles = [x['Title'] for x in json.loads(files['.movies.txt'])]
+    assert 'Binary' in titles and 'Text' in titles
+# end test_bad_cover
+
+#--------------------------------------------------------------------------------------------------
+# @brief Merging refuses an incomplete set of shards.
+def test_merge_missing_shard(tmp_path):
+    root = str(tmp_path / 'library')
+    library(root)
+
+    sharded = str(tmp_path / 'sharded')
+    run(sharded, '--headless', '--directory', root, '--shard', f'0/{SHARDS}')
+    with pytest.raises(subprocess.CalledProcessError):
+        run(sharded, '--merge', f'.shard-0-of-{SHARDS}')
+    #
+# end test_merge_missing_shard
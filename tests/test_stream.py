@@ -0,0 +1,137 @@
+import os
+import sys
+
+from io     import BytesIO
+from struct import pack
+from time   import sleep, time
+
+import pytest
+
+pytest.importorskip('PyQt5.QtCore')
+pytest.importorskip('PIL.Image')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Mp4Parser import AtomSizeError, Mp4Parser, TimeLimitError, TruncatedError
+
+#--------------------------------------------------------------------------------------------------
+# @brief Build an atom from a tag and its payload (size 0 for an atom extending to the end).
+def atom(tag, payload, size=None):
+    return pack('!I4s', len(payload) + 8 if size is None else size, tag) + payload
+# end atom
+
+#--------------------------------------------------------------------------------------------------
+# @brief Build an iTunes data atom holding a value.
+def data(value):
+    return atom(b'data', pack('!II', 1, 0) + value)
+# end data
+
+#--------------------------------------------------------------------------------------------------
+# @brief Build a movie atom with the meta data tags.
+def moov(*tags):
+    ilst = atom(b'ilst', b''.join(atom(tag, data(value)) for tag, value in tags))
+    return atom(b'moov', atom(b'udta', atom(b'meta', bytes(4) + ilst)))
+# end moov
+
+FTYP = atom(b'ftyp', b'M4V ' + bytes(4))
+TAGS = [(b'\xa9nam', b'Title'), (b'\xa9day', b'2001-02-03'), (b'\xa9gen', b'Drama, Comedy')]
+
+#--------------------------------------------------------------------------------------------------
+# @brief File with the meta data after the media data, as written by most encoders.
+MOOV_AT_END = FTYP + atom(b'mdat', bytes(100000)) + moov(*TAGS)
+
+#--------------------------------------------------------------------------------------------------
+# @brief Split data into chunks of a size.
+def chunks(content, size):
+    return (content[i:i+size] for i in range(0, len(content), size))
+# end chunks
+
+#--------------------------------------------------------------------------------------------------
+# @brief Readable stream that cannot seek, like a pipe or a socket.
+class Pipe(object):
+    def __init__(self, content): self._fd = BytesIO(content)
+    def read(self, count):       return self._fd.read(count)
+    def seekable(self):          return False
+# end Pipe
+
+#--------------------------------------------------------------------------------------------------
+# @brief A chunked iterable finds the meta data after the media data.
+def test_moov_at_end():
+    expected = dict(Mp4Parser(BytesIO(MOOV_AT_END)))
+    assert expected == { 'Title': 'Title', 'Released': '2001-02-03', 'Genre': ['Drama', 'Comedy'] }
+    assert dict(Mp4Parser(chunks(MOOV_AT_END, 4096))) == expected
+    assert dict(Mp4Parser(Pipe(MOOV_AT_END))) == expected
+# end test_moov_at_end
+
+#--------------------------------------------------------------------------------------------------
+# @brief Chunks that split the atom headers (and payloads) anywhere give the same results.
+@pytest.mark.parametrize('size', [1, 3, 7, 8, 13, 16])
+def test_split_headers(size):
+    content = FTYP + atom(b'mdat', bytes(100)) + moov(*TAGS)
+    assert dict(Mp4Parser(chunks(content, size))) == dict(Mp4Parser(BytesIO(content)))
+# end test_split_headers
+
+#--------------------------------------------------------------------------------------------------
+# @brief A size of 0 on an unbounded stream ends the stream.
+def test_size_zero_unbounded():
+    # media data to the end after the meta data is fine, the stream is not read any further
+    stream = iter([FTYP + moov(*TAGS) + atom(b'mdat', b'', size=0)] + [bytes(4096)] * 1000)
+    assert [x[0] for x in Mp4Parser().parse(stream)] == ['Title', 'Released', 'Genre']
+    assert next(stream, None) is not None
+
+    # media data to the end before the meta data hides it
+    assert dict(Mp4Parser(iter([FTYP + atom(b'mdat', b'', size=0) + moov(*TAGS)]))) == {}
+
+    # a tag cannot be read without knowing its size
+    with pytest.raises(AtomSizeError) as e:
+        Mp4Parser(iter([FTYP, atom(b'\xa9nam', data(b'Title'), size=0)]))
+    #
+    assert e.value.details()['Tag'] == '\xa9nam'
+# end test_size_zero_unbounded
+
+#--------------------------------------------------------------------------------------------------
+# @brief The events are yielded in file order, each as soon as its atom is read.
+def test_event_order():
+    content = FTYP + atom(b'moov', atom(b'udta', atom(b'meta', bytes(4) + atom(b'ilst',
+        atom(b'\xa9day', data(b'2001-02-03')) + atom(b'\xa9nam', data(b'First')) +
+        atom(b'\xa9gen', data(b'Drama, Comedy')) + atom(b'\xa9nam', data(b'Second'))))))
+    read = []
+    def source():
+        for chunk in chunks(content, 8):
+            read.append(len(chunk))
+            yield chunk
+        #
+    #
+    parser = Mp4Parser()
+    events = []
+    for key, value in parser.parse(source()):
+        events.append((key, value, sum(read)))
+    #
+    assert [x[:2] for x in events] == [('Released', '2001-02-03'), ('Title', 'First'),
+                                       ('Genre', ['Drama', 'Comedy']), ('Title', 'Second')]
+    assert [x[2] for x in events] == sorted(x[2] for x in events) and events[0][2] < len(content)
+    assert parser['Title'] == ['First', 'Second']
+# end test_event_order
+
+#--------------------------------------------------------------------------------------------------
+# @brief A stream ending inside an atom before the meta data is truncated.
+def test_truncated():
+    with pytest.raises(TruncatedError) as e: Mp4Parser(chunks(MOOV_AT_END[:50000], 4096))
+    assert e.value.details()['Tag'] == 'mdat'
+    assert dict(Mp4Parser(chunks(FTYP + moov(*TAGS) + atom(b'mdat', bytes(10))[:12], 5)))
+# end test_truncated
+
+#--------------------------------------------------------------------------------------------------
+# @brief The time limit applies while media data is discarded from a slow source.
+def test_time_limit_skipping():
+    def slow(): # about 5 seconds of a media data atom that claims to be huge
+        yield FTYP + pack('!I4sQ', 1, b'mdat', 2 ** 62)
+        for _ in range(500):
+            sleep(0.01)
+            yield bytes(65536)
+        #
+    #
+    start = time()
+    with pytest.raises(TimeLimitError) as e: Mp4Parser(slow(), { 'seconds': 0.5 })
+    assert e.value.details()['Tag'] == 'mdat'
+    assert time() - start < 5
+# end test_time_limit_skipping